@@ -3,37 +3,64 @@ Configuration Module
 Stores configuration settings and environment variables.
 """
 
+import functools
 import os
 from dotenv import load_dotenv
 
 
-# Load environment variables from .env file
-load_dotenv()
+@functools.lru_cache(maxsize=None)
+def _load_env():
+    """Load environment variables from .env file, once."""
+    load_dotenv()
+
+
+class _Setting:
+    """Config attribute read from the environment on first access."""
+    
+    def __init__(self, name, default, convert=str):
+        self.name = name
+        self.default = default
+        self.convert = convert
+        self.loaded = False
+        self.value = None
+    
+    def __get__(self, instance, owner=None):
+        # Same value for Config.X and Config().X, computed once per process
+        if not self.loaded:
+            _load_env()
+            self.value = self.convert(os.getenv(self.name, self.default))
+            self.loaded = True
+        return self.value
 
 
 class Config:
     """Configuration class for Gmail Summarizer."""
     
     # OpenAI API Key
-    API_KEY = os.getenv('OPENAI_API_KEY', '')
+    API_KEY = _Setting('OPENAI_API_KEY', '')
     
     # Gmail API credentials
-    CREDENTIALS_FILE = os.getenv('GMAIL_CREDENTIALS_FILE', 'credentials.json')
-    TOKEN_FILE = os.getenv('GMAIL_TOKEN_FILE', 'token.pickle')
+    CREDENTIALS_FILE = _Setting('GMAIL_CREDENTIALS_FILE', 'credentials.json')
+    TOKEN_FILE = _Setting('GMAIL_TOKEN_FILE', 'token.json')
+    
+    # On-disk cache for fetched messages and summaries (set empty to disable)
+    CACHE_DIR = _Setting('CACHE_DIR', '~/.cache/gmail_summarizer')
     
     # Email fetch settings
-    MAX_EMAILS = int(os.getenv('MAX_EMAILS', '10'))
+    MAX_EMAILS = _Setting('MAX_EMAILS', '10', int)
     
     # Email filter query (e.g., 'is:unread', 'from:example@email.com')
-    EMAIL_QUERY = os.getenv('EMAIL_QUERY', '')
+    EMAIL_QUERY = _Setting('EMAIL_QUERY', '')
     
     # Summarizer settings
-    SUMMARY_MAX_LENGTH = int(os.getenv('SUMMARY_MAX_LENGTH', '150'))
-    AI_MODEL = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
+    SUMMARY_MAX_LENGTH = _Setting('SUMMARY_MAX_LENGTH', '150', int)
+    AI_MODEL = _Setting('AI_MODEL', 'gpt-3.5-turbo')
     
     @classmethod
     def validate(cls):
         """Validate that required configuration is present."""
+        _load_env()
+        
         if not cls.API_KEY:
             raise ValueError(
                 "OPENAI_API_KEY not found. Please set it in .env file."
@@ -3,46 +3,163 @@ Gmail Client Module
 Handles authentication and email fetching from Gmail API.
 """
 
+import json
 import os
-import pickle
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import time
 from googleapiclient.errors import HttpError
-import base64
-from email.mime.text import MIMEText
-from datetime import datetime
+import binascii
+import codecs
+import html
 import re
 
+try:
+    # Optional C-backed HTML parser, used when installed
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
 
 # Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+# Gmail accepts up to 100 calls per batch request, but rate-limits batches
+# larger than about 50 per user, so stay at that size
+BATCH_SIZE = 50
+
+# Sub-requests that fail with these statuses are retried with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+
+# Headers read from each message
+HEADER_NAMES = ['Subject', 'From', 'Date']
+
+# Lowercase keys for the usual spellings, so most headers skip .lower()
+_HEADER_KEYS = {name: name.lower() for name in HEADER_NAMES}
+_WANTED_HEADERS = set(_HEADER_KEYS.values())
+_WANTED_LENGTHS = {len(name) for name in HEADER_NAMES}
+
+# Partial-response masks so Gmail skips attachments and unused fields
+# (covers parts nested up to three levels below the top-level payload)
+FULL_FIELDS = (
+    'id,payload(headers,mimeType,body/data,'
+    'parts(mimeType,body/data,'
+    'parts(mimeType,body/data,'
+    'parts(mimeType,body/data))))'
+)
+METADATA_FIELDS = 'id,payload/headers'
+
+# Matches a single HTML tag without backtracking across tags
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# Upper bound on the on-disk message cache, in bytes
+MESSAGE_CACHE_SIZE_LIMIT = 256 * 1024 * 1024
+
+# Longest body text handed to the summarizer, which then trims it to its
+# token budget; this only bounds how much we decode
+MAX_BODY_CHARS = 12000
+
+# HTML is decoded with extra headroom since markup is stripped afterwards
+HTML_MARKUP_FACTOR = 4
+
+# A UTF-8 character takes up to 4 bytes, so decode that many per character
+UTF8_MAX_BYTES = 4
+
+# Maps the base64url alphabet onto standard base64 for binascii
+_URLSAFE_TRANS = bytes.maketrans(b'-_', b'+/')
+
+
+def _orjson_model():
+    """
+    Build a Gmail response model that parses JSON with orjson.
+    
+    Returns:
+        A googleapiclient JsonModel, or None to use the default parser
+        when orjson isn't installed
+    """
+    try:
+        import orjson
+    except ImportError:
+        return None
+    from googleapiclient.model import JsonModel
+    
+    class OrjsonModel(JsonModel):
+        """JsonModel that deserializes responses with orjson."""
+        
+        def deserialize(self, content):
+            try:
+                body = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                # Match JsonModel: non-JSON bodies are returned as text
+                if isinstance(content, bytes):
+                    content = content.decode('utf-8')
+                return content
+            if self._data_wrapper and 'data' in body:
+                body = body['data']
+            return body
+    
+    return OrjsonModel()
+
 
 class GmailClient:
     """Client for interacting with Gmail API."""
     
-    def __init__(self, credentials_file='credentials.json', token_file='token.pickle'):
+    def __init__(self, credentials_file='credentials.json', token_file='token.json',
+                 cache_dir=None):
         """
         Initialize Gmail client with credentials.
         
         Args:
             credentials_file: Path to OAuth2 credentials JSON file
             token_file: Path to save/load authentication token
+            cache_dir: Directory for the on-disk message cache, or None to
+                always fetch from Gmail
         """
         self.credentials_file = credentials_file
         self.token_file = token_file
+        self._batch_results = {}
+        self._retry_ids = []
+        self.cache = None
+        if cache_dir:
+            import diskcache
+            
+            # Cached messages are mailbox contents; keep them owner-only
+            path = os.path.join(os.path.expanduser(cache_dir), 'messages')
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            os.chmod(path, 0o700)
+            self.cache = diskcache.Cache(
+                path,
+                disk=diskcache.JSONDisk,
+                size_limit=MESSAGE_CACHE_SIZE_LIMIT,
+                eviction_policy='least-recently-used'
+            )
         self.service = self._authenticate()
     
+    def close(self):
+        """Close the on-disk message cache, if any."""
+        if self.cache is not None:
+            self.cache.close()
+    
     def _authenticate(self):
         """Authenticate with Gmail API and return service object."""
+        # Imported here so startup stays fast until Gmail is actually needed
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from googleapiclient.discovery import build
+        
         creds = None
         
-        # Load existing token if available
+        # Load existing token if available; an unreadable file (e.g. an old
+        # token.pickle) just means authorizing again
         if os.path.exists(self.token_file):
-            with open(self.token_file, 'rb') as token:
-                creds = pickle.load(token)
+            try:
+                with open(self.token_file) as token:
+                    creds = Credentials.from_authorized_user_info(
+                        json.load(token), SCOPES
+                    )
+            except ValueError:
+                print(f"Ignoring unreadable token file '{self.token_file}'.")
         
         # If credentials are invalid or don't exist, authenticate
         if not creds or not creds.valid:
@@ -59,138 +176,327 @@ class GmailClient:
                 creds = flow.run_local_server(port=0)
             
             # Save credentials for future use
-            with open(self.token_file, 'wb') as token:
-                pickle.dump(creds, token)
+            with open(self.token_file, 'w') as token:
+                token.write(creds.to_json())
         
-        return build('gmail', 'v1', credentials=creds)
+        # Use the discovery document bundled with googleapiclient instead
+        # of fetching it; the discovery cache would only add lookup overhead
+        return build(
+            'gmail', 'v1',
+            credentials=creds,
+            static_discovery=True,
+            cache_discovery=False,
+            model=_orjson_model()
+        )
     
-    def fetch_recent_emails(self, max_results=10, query=''):
+    def fetch_recent_emails(self, max_results=10, query='', need_body=True):
         """
         Fetch recent emails from Gmail.
         
         Args:
             max_results: Maximum number of emails to fetch
             query: Gmail search query (e.g., 'is:unread', 'from:example@email.com')
+            need_body: If False, only headers are fetched and 'body' is left
+                empty; use fetch_email_bodies() later for the ones you need
         
         Returns:
             List of email dictionaries with keys: id, from, subject, date, body
         """
+        message_ids = self.list_message_ids(max_results, query)
+        return [
+            email_data
+            for batch in self.iter_emails(message_ids, need_body)
+            for email_data in batch
+        ]
+    
+    def list_message_ids(self, max_results=10, query=''):
+        """
+        List the IDs of recent emails matching a query.
+        
+        Args:
+            max_results: Maximum number of IDs to return
+            query: Gmail search query (e.g., 'is:unread', 'from:example@email.com')
+        
+        Returns:
+            List of Gmail message IDs, newest first
+        """
         try:
-            # Fetch message IDs
             results = self.service.users().messages().list(
                 userId='me',
                 maxResults=max_results,
                 q=query
             ).execute()
-            
-            messages = results.get('messages', [])
-            
-            if not messages:
-                return []
-            
-            # Fetch full message details
-            emails = []
-            for message in messages:
-                email_data = self._get_email_details(message['id'])
-                if email_data:
-                    emails.append(email_data)
-            
-            return emails
         
         except HttpError as error:
             print(f'An error occurred: {error}')
             return []
+        
+        return [message['id'] for message in results.get('messages', [])]
     
-    def _get_email_details(self, message_id):
+    def fetch_email_bodies(self, emails):
         """
-        Get detailed information for a specific email.
+        Fill in the body of emails fetched with need_body=False.
         
         Args:
-            message_id: Gmail message ID
+            emails: Email dictionaries returned by fetch_recent_emails
         
         Returns:
-            Dictionary with email details
+            The same list, with 'body' populated where the fetch succeeded
         """
-        try:
-            message = self.service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format='full'
-            ).execute()
-            
-            headers = message['payload']['headers']
+        bodies = {
+            email_data['id']: email_data['body']
+            for batch in self.iter_emails([email['id'] for email in emails])
+            for email_data in batch
+        }
+        for email in emails:
+            email['body'] = bodies.get(email['id'], email['body'])
+        return emails
+    
+    def iter_emails(self, message_ids, need_body=True):
+        """
+        Fetch and parse messages, yielding them as each batch arrives.
+        
+        Cached messages are yielded before any request is made; the rest
+        are fetched in batches of BATCH_SIZE.
+        
+        Args:
+            message_ids: Gmail message IDs to fetch
+            need_body: Whether to fetch the body or headers only
+        
+        Yields:
+            Lists of email dictionaries; concatenated, they follow the order
+            of message_ids
+        """
+        if need_body:
+            get_kwargs = {'format': 'full', 'fields': FULL_FIELDS}
+        else:
+            get_kwargs = {
+                'format': 'metadata',
+                'metadataHeaders': HEADER_NAMES,
+                'fields': METADATA_FIELDS
+            }
+        
+        # Messages are immutable, so cached message resources never go
+        # stale; they are parsed again on every read, so parser changes
+        # apply to cached messages too
+        use_cache = need_body and self.cache is not None
+        self._batch_results = {}
+        if use_cache:
+            for message_id in message_ids:
+                message = self.cache.get(self._cache_key(message_id))
+                if message is not None:
+                    self._batch_results[message_id] = message
+        
+        missing = [
+            message_id for message_id in message_ids
+            if message_id not in self._batch_results
+        ]
+        chunks = [
+            missing[start:start + BATCH_SIZE]
+            for start in range(0, len(missing), BATCH_SIZE)
+        ]
+        done = set(self._batch_results)
+        position = 0
+        
+        # The leading empty chunk yields cache hits before the first request
+        for chunk in [[]] + chunks:
+            if chunk:
+                try:
+                    self._execute_batch(chunk, get_kwargs)
+                except HttpError as error:
+                    print(f'An error occurred: {error}')
+                    return
+                done.update(chunk)
+                
+                if use_cache:
+                    for message_id in chunk:
+                        if message_id in self._batch_results:
+                            self.cache.set(
+                                self._cache_key(message_id),
+                                self._batch_results[message_id]
+                            )
             
-            # Extract headers
-            subject = self._get_header(headers, 'Subject')
-            from_email = self._get_header(headers, 'From')
-            date = self._get_header(headers, 'Date')
+            # Callbacks may fire out of order; release emails in list order
+            ready = []
+            while position < len(message_ids) and message_ids[position] in done:
+                message = self._batch_results.get(message_ids[position])
+                if message:
+                    ready.append(self._parse_email(message))
+                position += 1
+            if ready:
+                yield ready
+    
+    def _cache_key(self, message_id):
+        """Key a cached message by its ID and the fields it was fetched with."""
+        return f'{message_id}|{FULL_FIELDS}'
+    
+    def _execute_batch(self, message_ids, get_kwargs):
+        """
+        Fetch one batch of messages into self._batch_results.
+        
+        Sub-requests rejected with a rate-limit or server error are sent
+        again in a follow-up batch, with exponential backoff.
+        
+        Args:
+            message_ids: Gmail message IDs to fetch (at most BATCH_SIZE)
+            get_kwargs: Extra arguments for messages.get
+        """
+        pending = message_ids
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
             
-            # Extract body
-            body = self._get_email_body(message['payload'])
+            self._retry_ids = []
+            batch = self.service.new_batch_http_request(
+                callback=self._collect
+            )
+            for message_id in pending:
+                batch.add(
+                    self.service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        **get_kwargs
+                    ),
+                    request_id=message_id
+                )
+            batch.execute()
             
-            return {
-                'id': message_id,
-                'subject': subject,
-                'from': from_email,
-                'date': date,
-                'body': body
-            }
+            pending = self._retry_ids
+            if not pending:
+                return
         
-        except HttpError as error:
-            print(f'Error fetching email {message_id}: {error}')
-            return None
+        for message_id in pending:
+            print(f'Error fetching email {message_id}: '
+                  f'still failing after {MAX_RETRIES} retries')
     
-    def _get_header(self, headers, name):
-        """Extract a specific header value from email headers."""
+    def _collect(self, request_id, response, exception):
+        """
+        Batch callback that stores each fetched message resource.
+        
+        Args:
+            request_id: Gmail message ID the request was added with
+            response: Message resource returned by the API
+            exception: HttpError if the request failed, otherwise None
+        """
+        if exception is not None:
+            if (isinstance(exception, HttpError)
+                    and exception.resp.status in RETRY_STATUSES):
+                self._retry_ids.append(request_id)
+            else:
+                print(f'Error fetching email {request_id}: {exception}')
+            return
+        self._batch_results[request_id] = response
+    
+    def _parse_email(self, message):
+        """
+        Extract the fields we need from a Gmail message resource.
+        
+        Args:
+            message: Message resource returned by messages.get
+        
+        Returns:
+            Dictionary with email details
+        """
+        headers = message['payload']['headers']
+        
+        # Extract headers (names are case-insensitive; first one wins)
+        hdr = {}
         for header in headers:
-            if header['name'].lower() == name.lower():
-                return header['value']
-        return ''
+            name = header['name']
+            key = _HEADER_KEYS.get(name)
+            if key is None:
+                # Only lowercase names that could be an odd spelling of ours
+                if len(name) not in _WANTED_LENGTHS:
+                    continue
+                key = name.lower()
+                if key not in _WANTED_HEADERS:
+                    continue
+            hdr.setdefault(key, header['value'])
+        subject = hdr.get('subject', '')
+        from_email = hdr.get('from', '')
+        date = hdr.get('date', '')
+        
+        # Extract body
+        body = self._get_email_body(message['payload'])
+        
+        return {
+            'id': message['id'],
+            'subject': subject,
+            'from': from_email,
+            'date': date,
+            'body': body
+        }
     
-    def _get_email_body(self, payload):
+    def _get_email_body(self, payload, max_chars=MAX_BODY_CHARS):
         """
         Extract email body from payload.
         
+        Only enough base64 data to produce max_chars characters is decoded
+        (sized for multi-byte UTF-8), so large bodies are never decoded in
+        full.
+        
         Args:
             payload: Email payload from Gmail API
+            max_chars: Maximum length of the returned body
         
         Returns:
             Email body as string
         """
-        body = ''
-        
-        if 'parts' in payload:
-            # Multipart email
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
-                        body = base64.urlsafe_b64decode(
-                            part['body']['data']
-                        ).decode('utf-8')
-                        break
-                elif part['mimeType'] == 'text/html' and not body:
-                    if 'data' in part['body']:
-                        html_body = base64.urlsafe_b64decode(
-                            part['body']['data']
-                        ).decode('utf-8')
-                        body = self._strip_html(html_body)
-        else:
-            # Simple email
-            if 'data' in payload['body']:
-                body = base64.urlsafe_b64decode(
-                    payload['body']['data']
-                ).decode('utf-8')
-        
-        return body.strip()
-    
-    def _strip_html(self, html):
-        """Remove HTML tags from text."""
-        # Remove HTML tags
-        clean = re.compile('<.*?>')
-        text = re.sub(clean, '', html)
-        # Decode HTML entities
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&amp;', '&')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
-        return text.strip()
+        # Prefer the first text/plain part, fall back to the first text/html
+        html_data = None
+        for mime_type, data in self._walk_text_parts(payload):
+            if mime_type == 'text/plain':
+                body = self._decode_body(data, max_chars)
+                return body.strip()[:max_chars]
+            if mime_type == 'text/html' and html_data is None:
+                html_data = data
+        
+        if html_data is None:
+            return ''
+        html_chars = max_chars * HTML_MARKUP_FACTOR
+        html_body = self._decode_body(html_data, html_chars)
+        if len(html_data) > self._decode_limit(html_chars):
+            # Drop a tag cut off by truncation, which has no closing '>'
+            last_open = html_body.rfind('<')
+            if last_open > html_body.rfind('>'):
+                html_body = html_body[:last_open]
+        return self._strip_html(html_body)[:max_chars]
+    
+    def _walk_text_parts(self, payload):
+        """
+        Yield (mimeType, data) for every text part with inline data.
+        
+        Walks nested multipart trees depth-first in document order.
+        """
+        stack = [payload]
+        while stack:
+            part = stack.pop()
+            mime_type = part.get('mimeType', '')
+            data = part.get('body', {}).get('data')
+            if mime_type.startswith('text/') and data:
+                yield mime_type, data
+            stack.extend(reversed(part.get('parts', [])))
+    
+    def _decode_body(self, data, max_chars):
+        """Decode enough base64url body data for at least max_chars characters."""
+        limit = self._decode_limit(max_chars)
+        truncated = len(data) > limit
+        raw = binascii.a2b_base64(
+            data[:limit].encode('ascii').translate(_URLSAFE_TRANS)
+        )
+        if not truncated:
+            return raw.decode('utf-8', errors='replace')
+        # Without final=True the decoder holds back a character cut in half
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        return decoder.decode(raw, final=False)
+    
+    def _decode_limit(self, max_chars):
+        """Number of base64 characters decoded for max_chars characters."""
+        # Every 4 base64 characters hold 3 bytes; keep whole 4-char groups
+        return (max_chars * UTF8_MAX_BYTES * 4 // 3 + 4) // 4 * 4
+    
+    def _strip_html(self, html_text):
+        """Remove HTML tags from text and decode entities."""
+        if HTMLParser is not None:
+            return HTMLParser(html_text).text(separator=' ').strip()
+        return html.unescape(_TAG_RE.sub('', html_text)).strip()
@@ -3,52 +3,112 @@ Gmail Summarizer - Main Script
 This script fetches emails from Gmail and generates summaries using AI.
 """
 
-import os
+import asyncio
 from gmail_client import GmailClient
-from summarizer import EmailSummarizer
+from summarizer import EmailSummarizer, MAX_CONCURRENT_REQUESTS
 from config import Config
 
 
+# Fetched emails waiting to be printed
+PIPELINE_QUEUE_SIZE = 16
+
+
+async def print_summaries(gmail_client, summarizer, message_ids):
+    """
+    Fetch, summarize and print emails as a pipeline.
+    
+    A producer fetches emails in a worker thread and starts each summary as
+    soon as its email lands; summaries are then printed in inbox order,
+    streaming as they arrive.
+    """
+    queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    
+    async def produce():
+        loop = asyncio.get_running_loop()
+        batches = gmail_client.iter_emails(message_ids)
+        try:
+            while True:
+                # The Gmail client blocks, so keep it off the event loop
+                batch = await loop.run_in_executor(None, next, batches, None)
+                if batch is None:
+                    break
+                for email in batch:
+                    stream = summarizer.start_summary_stream(
+                        email['body'], semaphore=semaphore
+                    )
+                    await queue.put((email, stream))
+        finally:
+            await queue.put(None)
+    
+    producer = asyncio.ensure_future(produce())
+    try:
+        i = 0
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            email, stream = item
+            i += 1
+            
+            print(f"\n[Email {i}]")
+            print(f"From: {email['from']}")
+            print(f"Subject: {email['subject']}")
+            print(f"Date: {email['date']}")
+            print("-" * 50)
+            print("Summary:")
+            async for text in stream:
+                print(text, end='', flush=True)
+            print()
+            print("=" * 50)
+        
+        await producer
+    finally:
+        await summarizer.aclose()
+
+
 def main():
     """Main function to run the Gmail Summarizer."""
     print("=" * 50)
     print("Gmail Summarizer")
     print("=" * 50)
     
-    # Initialize configuration
+    # Initialize configuration and fail fast before loading API clients
     config = Config()
+    config.validate()
     
     # Initialize Gmail client
     print("\n[1/3] Connecting to Gmail...")
-    gmail_client = GmailClient(config.CREDENTIALS_FILE, config.TOKEN_FILE)
+    gmail_client = GmailClient(
+        config.CREDENTIALS_FILE, config.TOKEN_FILE, config.CACHE_DIR
+    )
     
     # Initialize summarizer
     print("[2/3] Initializing AI summarizer...")
-    summarizer = EmailSummarizer(config.API_KEY)
+    summarizer = EmailSummarizer(config.API_KEY, cache_dir=config.CACHE_DIR)
     
+    try:
+        summarize_emails(config, gmail_client, summarizer)
+    finally:
+        summarizer.close()
+        gmail_client.close()
+
+
+def summarize_emails(config, gmail_client, summarizer):
+    """Fetch emails and print a summary for each one."""
     # Fetch emails
     print(f"[3/3] Fetching last {config.MAX_EMAILS} emails...")
-    emails = gmail_client.fetch_recent_emails(max_results=config.MAX_EMAILS)
+    message_ids = gmail_client.list_message_ids(max_results=config.MAX_EMAILS)
     
-    if not emails:
+    if not message_ids:
         print("\nNo emails found.")
         return
     
-    print(f"\nFound {len(emails)} emails. Generating summaries...\n")
+    print(f"\nFound {len(message_ids)} emails. Generating summaries...\n")
     print("=" * 50)
     
-    # Summarize each email
-    for i, email in enumerate(emails, 1):
-        print(f"\n[Email {i}/{len(emails)}]")
-        print(f"From: {email['from']}")
-        print(f"Subject: {email['subject']}")
-        print(f"Date: {email['date']}")
-        print("-" * 50)
-        
-        # Generate summary
-        summary = summarizer.summarize(email['body'])
-        print(f"Summary:\n{summary}")
-        print("=" * 50)
+    # Summarize emails while later ones are still being fetched
+    asyncio.run(print_summaries(gmail_client, summarizer, message_ids))
     
     print("\n✓ Summarization complete!")
 
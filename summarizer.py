@@ -3,24 +3,151 @@ Email Summarizer Module
 Generates summaries of email content using AI.
 """
 
-from openai import OpenAI
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import os
+from typing import AsyncIterator, Iterator, Optional
+
+
+# Maximum number of chat completions in flight at once
+MAX_CONCURRENT_REQUESTS = 8
+
+# Connection pool shared by all requests from one summarizer
+MAX_CONNECTIONS = 32
+REQUEST_TIMEOUT_SECONDS = 60.0
+CONNECT_TIMEOUT_SECONDS = 5.0
+
+# Longest email body sent to the model, in tokens
+MAX_INPUT_TOKENS = 3000
+
+# Limits for packing several emails into one summarize_many() request
+MAX_BATCH_TOKENS = 8000
+MAX_BATCH_EMAILS = 10
+
+# Fallback tokenizer for models tiktoken doesn't know
+DEFAULT_ENCODING = "cl100k_base"
+
+# Tokenizers are expensive to load, so share them across summarizers
+_ENCODINGS = {}
+
+# Upper bound on the on-disk summary cache, in bytes
+SUMMARY_CACHE_SIZE_LIMIT = 64 * 1024 * 1024
+
+
+def _get_encoding(model: str):
+    """
+    Return the (cached) tiktoken encoding for a model.
+    
+    On first use tiktoken downloads the encoding's BPE file (cached under
+    TIKTOKEN_CACHE_DIR or the system temp dir), so this needs network
+    access once; failures propagate to the caller.
+    """
+    if model not in _ENCODINGS:
+        import tiktoken
+        try:
+            _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _ENCODINGS[model] = tiktoken.get_encoding(DEFAULT_ENCODING)
+    return _ENCODINGS[model]
+
+
+def _http_options() -> dict:
+    """Keyword arguments for the pooled httpx clients."""
+    import httpx
+    
+    return {
+        "http2": True,
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS
+        ),
+        "timeout": httpx.Timeout(
+            REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS
+        )
+    }
 
 
 class EmailSummarizer:
     """Summarizes email content using OpenAI GPT."""
     
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo",
+                 cache_dir: Optional[str] = None):
         """
         Initialize the email summarizer.
         
         Args:
             api_key: OpenAI API key
             model: Model to use for summarization (default: gpt-3.5-turbo)
+            cache_dir: Directory for the on-disk summary cache, or None to
+                always call the API
+        
+        Raises:
+            Exception: If the model's tokenizer can't be loaded, e.g. when
+                tiktoken's first-use download fails
         """
+        # Imported here so startup stays fast until a summarizer is created
+        import httpx
+        from openai import OpenAI
+        
         self.api_key = api_key
         self.model = model
-        self.client = OpenAI(api_key=api_key)
+        self._enc = _get_encoding(model)
+        
+        # Keep-alive HTTP/2 pools avoid a TLS handshake per request
+        self._http = httpx.Client(**_http_options())
+        self.client = OpenAI(api_key=api_key, http_client=self._http)
+        
+        # The async client is created on first use, inside the event loop
+        # that will also close it
+        self._ahttp = None
+        self._aclient = None
+        
+        self.cache = None
+        if cache_dir:
+            import diskcache
+            
+            # Summaries reveal mailbox contents; keep them owner-only
+            path = os.path.join(os.path.expanduser(cache_dir), 'summaries')
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            os.chmod(path, 0o700)
+            self.cache = diskcache.Cache(
+                path,
+                disk=diskcache.JSONDisk,
+                size_limit=SUMMARY_CACHE_SIZE_LIMIT,
+                eviction_policy='least-recently-used'
+            )
+    
+    @property
+    def aclient(self):
+        """AsyncOpenAI client, created on first use in the running loop."""
+        if self._aclient is None:
+            import httpx
+            from openai import AsyncOpenAI
+            
+            self._ahttp = httpx.AsyncClient(**_http_options())
+            self._aclient = AsyncOpenAI(
+                api_key=self.api_key, http_client=self._ahttp
+            )
+        return self._aclient
+    
+    def close(self):
+        """Close the sync HTTP connections and the summary cache."""
+        self._http.close()
+        if self.cache is not None:
+            self.cache.close()
+    
+    async def aclose(self):
+        """
+        Close the async HTTP connections, if any were opened.
+        
+        Callers of the async methods must await this before their event
+        loop ends; close() can't do it because it runs outside the loop.
+        """
+        if self._ahttp is not None:
+            await self._ahttp.aclose()
+            self._ahttp = None
+            self._aclient = None
     
     def summarize(self, email_body: str, max_length: int = 150) -> str:
         """
@@ -33,37 +160,228 @@ class EmailSummarizer:
         Returns:
             Summary of the email
         """
-        if not email_body or len(email_body.strip()) == 0:
-            return "No content to summarize."
+        early = self._early_summary(email_body, max_length)
+        if early is not None:
+            return early
+        
+        try:
+            response = self.client.chat.completions.create(
+                **self._completion_kwargs(email_body, max_length)
+            )
+            choice = response.choices[0]
+            return self._finish_summary(
+                email_body, max_length, choice.message.content,
+                choice.finish_reason
+            )
+        
+        except Exception as e:
+            return self._error_summary(e)
+    
+    async def summarize_async(self, email_body: str, max_length: int = 150) -> str:
+        """
+        Summarize an email body without blocking the event loop.
+        
+        Args:
+            email_body: The email content to summarize
+            max_length: Maximum length of summary in words
         
-        # Truncate very long emails to avoid token limits
-        if len(email_body) > 4000:
-            email_body = email_body[:4000] + "..."
+        Returns:
+            Summary of the email
+        """
+        early = self._early_summary(email_body, max_length)
+        if early is not None:
+            return early
         
         try:
-            prompt = self._create_prompt(email_body, max_length)
+            response = await self.aclient.chat.completions.create(
+                **self._completion_kwargs(email_body, max_length)
+            )
+            choice = response.choices[0]
+            return self._finish_summary(
+                email_body, max_length, choice.message.content,
+                choice.finish_reason
+            )
+        
+        except Exception as e:
+            return self._error_summary(e)
+    
+    def summarize_stream(self, email_body: str, max_length: int = 150) -> Iterator[str]:
+        """
+        Summarize an email body, yielding text as the model generates it.
+        
+        Args:
+            email_body: The email content to summarize
+            max_length: Maximum length of summary in words
+        
+        Yields:
+            Chunks of the summary text
+        """
+        early = self._early_summary(email_body, max_length)
+        if early is not None:
+            yield early
+            return
+        
+        try:
+            stream = self.client.chat.completions.create(
+                **self._completion_kwargs(email_body, max_length),
+                stream=True
+            )
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that summarizes emails concisely and accurately."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=300,
-                temperature=0.5
+            parts = []
+            finish_reason = None
+            for chunk in stream:
+                text, finish_reason = self._read_chunk(chunk, finish_reason)
+                if text:
+                    parts.append(text)
+                    yield text
+            self._finish_summary(
+                email_body, max_length, ''.join(parts), finish_reason
+            )
+        
+        except Exception as e:
+            yield self._error_summary(e)
+    
+    async def summarize_stream_async(self, email_body: str,
+                                     max_length: int = 150) -> AsyncIterator[str]:
+        """
+        Async counterpart of summarize_stream().
+        
+        Args:
+            email_body: The email content to summarize
+            max_length: Maximum length of summary in words
+        
+        Yields:
+            Chunks of the summary text
+        """
+        early = self._early_summary(email_body, max_length)
+        if early is not None:
+            yield early
+            return
+        
+        try:
+            stream = await self.aclient.chat.completions.create(
+                **self._completion_kwargs(email_body, max_length),
+                stream=True
             )
             
-            summary = response.choices[0].message.content.strip()
-            return summary
+            parts = []
+            finish_reason = None
+            async for chunk in stream:
+                text, finish_reason = self._read_chunk(chunk, finish_reason)
+                if text:
+                    parts.append(text)
+                    yield text
+            self._finish_summary(
+                email_body, max_length, ''.join(parts), finish_reason
+            )
         
         except Exception as e:
-            return f"Error generating summary: {str(e)}"
+            yield self._error_summary(e)
+    
+    def _early_summary(self, email_body: str, max_length: int) -> Optional[str]:
+        """
+        Answer without calling the API when possible.
+        
+        Returns:
+            A placeholder for empty emails, a cached summary, or None if
+            the model has to be asked
+        """
+        if not email_body or len(email_body.strip()) == 0:
+            return "No content to summarize."
+        return self._cached_summary(email_body, max_length)
+    
+    def _finish_summary(self, email_body: str, max_length: int, content: str,
+                        finish_reason: Optional[str] = None) -> str:
+        """
+        Clean up a generated summary and store it for later runs.
+        
+        Summaries cut off by the max_tokens limit are returned but not
+        cached, so a later run gets another chance at a complete one.
+        """
+        summary = (content or '').strip()
+        if finish_reason != 'length':
+            self._store_summary(email_body, max_length, summary)
+        return summary
+    
+    def _error_summary(self, error: Exception) -> str:
+        """Text shown in place of a summary when the API call fails."""
+        return f"Error generating summary: {str(error)}"
+    
+    def _read_chunk(self, chunk, finish_reason: Optional[str]) -> tuple:
+        """
+        Read a streamed completion chunk.
+        
+        Returns:
+            Tuple of (text carried by the chunk or None, finish reason so far)
+        """
+        if not chunk.choices:
+            return None, finish_reason
+        choice = chunk.choices[0]
+        return choice.delta.content, choice.finish_reason or finish_reason
+    
+    def _cache_key(self, email_body: str, max_length: int) -> str:
+        """Key a summary by everything that affects the model's output."""
+        return hashlib.sha256(
+            f"{self.model}|{max_length}|{email_body}".encode()
+        ).hexdigest()
+    
+    def _cached_summary(self, email_body: str, max_length: int) -> Optional[str]:
+        """Return a previously stored summary, or None on a miss."""
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(email_body, max_length))
+    
+    def _store_summary(self, email_body: str, max_length: int, summary: str):
+        """Store a successful, non-empty summary for later runs."""
+        if summary and self.cache is not None:
+            self.cache.set(self._cache_key(email_body, max_length), summary)
+    
+    def _truncate(self, email_body: str) -> tuple:
+        """
+        Truncate very long emails to avoid token limits.
+        
+        Returns:
+            Tuple of (email body, its length in tokens)
+        """
+        # Email text may contain things like "<|endoftext|>"; count them as
+        # plain text instead of letting tiktoken reject them
+        tokens = self._enc.encode(email_body, disallowed_special=())
+        if len(tokens) > MAX_INPUT_TOKENS:
+            return (
+                self._enc.decode(tokens[:MAX_INPUT_TOKENS]) + "...",
+                MAX_INPUT_TOKENS
+            )
+        return email_body, len(tokens)
+    
+    def _completion_kwargs(self, email_body: str, max_length: int) -> dict:
+        """
+        Build the chat completion arguments for an email.
+        
+        Args:
+            email_body: The email content
+            max_length: Maximum length of summary in words
+        
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
+        email_body, _ = self._truncate(email_body)
+        prompt = self._create_prompt(email_body, max_length)
+        
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are a helpful assistant that summarizes emails concisely and accurately."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": 300,
+            "temperature": 0.5
+        }
     
     def _create_prompt(self, email_body: str, max_length: int) -> str:
         """
@@ -85,6 +403,116 @@ Email content:
 Summary:"""
         return prompt
     
+    def summarize_many(self, bodies: list, max_length: int = 150) -> list:
+        """
+        Summarize several email bodies with as few requests as possible.
+        
+        Bodies are packed into shared requests of up to MAX_BATCH_EMAILS
+        emails or MAX_BATCH_TOKENS input tokens, which saves per-request
+        overhead for inboxes full of short emails. A group whose response
+        can't be parsed falls back to one summarize() call per email.
+        
+        Args:
+            bodies: Email contents to summarize
+            max_length: Maximum length of each summary in words
+        
+        Returns:
+            List of summaries, in the same order as bodies
+        """
+        summaries = [None] * len(bodies)
+        groups = []
+        group = []
+        group_tokens = 0
+        for i, body in enumerate(bodies):
+            if not body or len(body.strip()) == 0:
+                summaries[i] = "No content to summarize."
+                continue
+            summaries[i] = self._cached_summary(body, max_length)
+            if summaries[i] is not None:
+                continue
+            
+            try:
+                text, n_tokens = self._truncate(body)
+            except Exception:
+                # Leave this email to summarize(), which reports the error
+                summaries[i] = self.summarize(body, max_length)
+                continue
+            if group and (len(group) == MAX_BATCH_EMAILS
+                          or group_tokens + n_tokens > MAX_BATCH_TOKENS):
+                groups.append(group)
+                group = []
+                group_tokens = 0
+            group.append((i, text))
+            group_tokens += n_tokens
+        if group:
+            groups.append(group)
+        
+        for group in groups:
+            results = self._summarize_group([text for _, text in group], max_length)
+            for (i, _), summary in zip(group, results):
+                if summary is None:
+                    summary = self.summarize(bodies[i], max_length)
+                else:
+                    self._store_summary(bodies[i], max_length, summary)
+                summaries[i] = summary
+        
+        return summaries
+    
+    def _summarize_group(self, bodies: list, max_length: int) -> list:
+        """
+        Summarize a group of emails in a single request.
+        
+        Args:
+            bodies: Truncated email contents
+            max_length: Maximum length of each summary in words
+        
+        Returns:
+            List of summaries, or a list of None if the request or its
+            JSON response failed
+        """
+        # A lone email is cheaper through the regular single-email prompt
+        if len(bodies) == 1:
+            return [None]
+        
+        prompt = (
+            f"Summarize each email below in approximately {max_length} words or less. "
+            "Focus on the key points, action items, and important information. "
+            'Return a JSON object {"summaries": [...]} with one string per '
+            "email, in the same order."
+        )
+        for i, body in enumerate(bodies, 1):
+            prompt += f"\n\n---EMAIL {i}---\n{body}"
+        
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a helpful assistant that summarizes emails concisely and accurately."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                max_tokens=300 * len(bodies),
+                temperature=0.5,
+                response_format={"type": "json_object"}
+            )
+            
+            choice = response.choices[0]
+            if choice.finish_reason == 'length':
+                return [None] * len(bodies)
+            summaries = json.loads(choice.message.content)["summaries"]
+            if (len(summaries) != len(bodies)
+                    or not all(isinstance(summary, str) for summary in summaries)):
+                return [None] * len(bodies)
+            return [summary.strip() for summary in summaries]
+        
+        except Exception:
+            return [None] * len(bodies)
+    
     def batch_summarize(self, emails: list) -> list:
         """
         Summarize multiple emails.
@@ -104,3 +532,83 @@ Summary:"""
                 'summary': summary
             })
         return summaries
+    
+    async def batch_summarize_async(self, emails: list, max_length: int = 150) -> list:
+        """
+        Summarize multiple emails concurrently.
+        
+        At most MAX_CONCURRENT_REQUESTS completions are in flight at once
+        to stay within OpenAI rate limits.
+        
+        Args:
+            emails: List of email dictionaries with 'body' key
+            max_length: Maximum length of each summary in words
+        
+        Returns:
+            List of summaries, in the same order as emails
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        
+        async def summarize_one(body):
+            async with semaphore:
+                return await self.summarize_async(body, max_length)
+        
+        # Only cache misses take a request slot
+        bodies = [email.get('body', '') for email in emails]
+        summaries = [self._cached_summary(body, max_length) for body in bodies]
+        misses = [i for i, summary in enumerate(summaries) if summary is None]
+        results = await asyncio.gather(
+            *[summarize_one(bodies[i]) for i in misses]
+        )
+        for i, summary in zip(misses, results):
+            summaries[i] = summary
+        
+        return [
+            {
+                'email_id': email.get('id'),
+                'subject': email.get('subject'),
+                'summary': summary
+            }
+            for email, summary in zip(emails, summaries)
+        ]
+    
+    def start_summary_stream(self, email_body: str, max_length: int = 150,
+                             semaphore: Optional[asyncio.Semaphore] = None
+                             ) -> AsyncIterator[str]:
+        """
+        Start summarizing an email in the background.
+        
+        The summary is generated right away and buffered, so the returned
+        iterator can be consumed later without losing time. Must be called
+        from a running event loop.
+        
+        Args:
+            email_body: The email content to summarize
+            max_length: Maximum length of summary in words
+            semaphore: Optional semaphore bounding concurrent requests
+        
+        Returns:
+            Async iterator of summary text chunks
+        """
+        if semaphore is None:
+            # An unshared semaphore never makes this request wait
+            semaphore = asyncio.Semaphore(1)
+        queue = asyncio.Queue()
+        
+        async def produce():
+            try:
+                async with semaphore:
+                    async for text in self.summarize_stream_async(email_body, max_length):
+                        queue.put_nowait(text)
+            finally:
+                queue.put_nowait(None)
+        
+        async def consume(task):
+            while True:
+                text = await queue.get()
+                if text is None:
+                    break
+                yield text
+            await task
+        
+        return consume(asyncio.ensure_future(produce()))